@@ -1,14 +1,103 @@
 import argparse
-import csv
 import logging
+import os
 import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+
+import pandas as pd
 from tqdm import tqdm
 
 from fetch_stop_areas import setup_logging
 
 
+CREATE_TRAINS_SQL = """
+CREATE TABLE IF NOT EXISTS trains (
+    train_instance_id TEXT PRIMARY KEY,
+    vehicle_journey_id TEXT NOT NULL,
+    service_date DATE NOT NULL,
+
+    stop_area_id TEXT NOT NULL,
+    train_type TEXT,
+
+    scheduled_time TIMESTAMP NOT NULL,
+    realtime_time TIMESTAMP,
+
+    delay_sec INTEGER,
+    possibly_cancelled BOOLEAN,
+
+    nb_observations INTEGER,
+    seen_base_schedule BOOLEAN,
+    seen_realtime BOOLEAN,
+
+    last_seen_delta_sec INTEGER,
+    last_poll_timestamp TIMESTAMP,
+
+    weather_hour TEXT
+)
+"""
+
+# All trains columns, in table order.
+TRAIN_COLUMNS = (
+    "train_instance_id, vehicle_journey_id, service_date, stop_area_id, "
+    "train_type, scheduled_time, realtime_time, delay_sec, "
+    "possibly_cancelled, nb_observations, seen_base_schedule, "
+    "seen_realtime, last_seen_delta_sec, last_poll_timestamp, "
+    "weather_hour"
+)
+
+UPSERT_SQL = f"""
+INSERT INTO trains ({TRAIN_COLUMNS}) VALUES (
+    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+)
+ON CONFLICT(train_instance_id) DO UPDATE SET
+    realtime_time = excluded.realtime_time,
+    weather_hour = excluded.weather_hour,
+    delay_sec = excluded.delay_sec,
+    last_seen_delta_sec = excluded.last_seen_delta_sec,
+    last_poll_timestamp = excluded.last_poll_timestamp,
+
+    nb_observations = trains.nb_observations + 1,
+    seen_base_schedule = MAX(trains.seen_base_schedule, excluded.seen_base_schedule),
+    seen_realtime = MAX(trains.seen_realtime, excluded.seen_realtime),
+    train_type = COALESCE(trains.train_type, excluded.train_type),
+    possibly_cancelled = trains.possibly_cancelled
+
+WHERE excluded.last_poll_timestamp > trains.last_poll_timestamp
+"""
+
+# Merge one staging table into the main trains table. Same conflict
+# rules as UPSERT_SQL, except nb_observations adds the staged count
+# (each staged row already aggregates several observations).
+MERGE_SQL = f"""
+INSERT INTO trains ({TRAIN_COLUMNS})
+SELECT {TRAIN_COLUMNS} FROM staging.trains WHERE true
+ON CONFLICT(train_instance_id) DO UPDATE SET
+    realtime_time = excluded.realtime_time,
+    weather_hour = excluded.weather_hour,
+    delay_sec = excluded.delay_sec,
+    last_seen_delta_sec = excluded.last_seen_delta_sec,
+    last_poll_timestamp = excluded.last_poll_timestamp,
+
+    nb_observations = trains.nb_observations + excluded.nb_observations,
+    seen_base_schedule = MAX(trains.seen_base_schedule, excluded.seen_base_schedule),
+    seen_realtime = MAX(trains.seen_realtime, excluded.seen_realtime),
+    train_type = COALESCE(trains.train_type, excluded.train_type),
+    possibly_cancelled = trains.possibly_cancelled
+
+WHERE excluded.last_poll_timestamp > trains.last_poll_timestamp
+"""
+
+# First merge into an empty trains table: staging primary keys are
+# unique, so no conflict machinery is needed.
+BOOTSTRAP_MERGE_SQL = f"""
+INSERT INTO trains ({TRAIN_COLUMNS})
+SELECT {TRAIN_COLUMNS} FROM staging.trains
+"""
+
+
 def init_db(db_path: Path) -> sqlite3.Connection:
     """
     Connect to an existing SQLite database and ensure that
@@ -17,106 +106,133 @@ def init_db(db_path: Path) -> sqlite3.Connection:
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS trains (
-        train_instance_id TEXT PRIMARY KEY,
-        vehicle_journey_id TEXT NOT NULL,
-        service_date DATE NOT NULL,
-
-        stop_area_id TEXT NOT NULL,
-        train_type TEXT,
-
-        scheduled_time TIMESTAMP NOT NULL,
-        realtime_time TIMESTAMP,
-
-        delay_sec INTEGER,
-        possibly_cancelled BOOLEAN,
-
-        nb_observations INTEGER,
-        seen_base_schedule BOOLEAN,
-        seen_realtime BOOLEAN,
-
-        last_seen_delta_sec INTEGER,
-        last_poll_timestamp TIMESTAMP
-    )
-    """)
+    # Bulk-insert friendly settings: WAL avoids writer blocking readers,
+    # NORMAL sync skips an fsync per commit (safe with WAL).
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-200000")
+
+    cur.execute(CREATE_TRAINS_SQL)
+
+    # weather_hour started out as a virtual generated column; it is
+    # now stored at ingest time. Rebuild older databases: add the
+    # column where missing (or still generated) and backfill it.
+    cols = {r[1]: r[6] for r in cur.execute("PRAGMA table_xinfo(trains)")}
+    backfill = False
+    if cols.get("weather_hour") == 2:  # 2 = virtual generated
+        cur.execute("DROP INDEX IF EXISTS idx_trains_weather_hour")
+        cur.execute("ALTER TABLE trains DROP COLUMN weather_hour")
+        del cols["weather_hour"]
+    if "weather_hour" not in cols:
+        cur.execute("ALTER TABLE trains ADD COLUMN weather_hour TEXT")
+        backfill = True
+    if backfill:
+        cur.execute("""
+        UPDATE trains SET weather_hour = strftime('%Y-%m-%d %H:00:00',
+            COALESCE(realtime_time, scheduled_time))
+        """)
 
     cur.execute("""
     CREATE INDEX IF NOT EXISTS idx_trains_last_poll
     ON trains(last_poll_timestamp)
     """)
 
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_trains_weather_hour
+    ON trains(stop_area_id, weather_hour)
+    """)
+
     conn.commit()
     return conn
 
 
+# poll_timestamp is identical for every row of a file and
+# scheduled/realtime times repeat across observations, so most
+# parse_dt calls hit this cache instead of re-parsing.
+_PARSE_CACHE: dict[str, datetime | None] = {}
+_PARSE_CACHE_MAX = 500_000
+
+
 def parse_dt(s: str | None) -> datetime | None:
     if not s:
         return None
 
-    for fmt in ("%Y%m%dT%H%M%S", "%Y-%m-%dT%H:%M:%S"):
+    if s in _PARSE_CACHE:
+        return _PARSE_CACHE[s]
+
+    dt = _parse_dt(s)
+    if len(_PARSE_CACHE) > _PARSE_CACHE_MAX:
+        _PARSE_CACHE.clear()
+    _PARSE_CACHE[s] = dt
+    return dt
+
+
+def _parse_dt(s: str) -> datetime | None:
+    # SNCF compact form (20240131T154500) is fixed-width: slice it
+    # directly instead of going through strptime's format machinery.
+    if len(s) == 15 and s[8] == "T":
         try:
-            return datetime.strptime(s, fmt)
-        except Exception:
-            pass
+            return datetime(
+                int(s[0:4]), int(s[4:6]), int(s[6:8]),
+                int(s[9:11]), int(s[11:13]), int(s[13:15])
+            )
+        except ValueError:
+            return None
 
     try:
         return datetime.fromisoformat(s)
-    except Exception:
+    except ValueError:
         return None
 
 
-def upsert_train(cur, row: dict):
-    poll_ts = parse_dt(row.get("poll_timestamp"))
-    sched_ts = parse_dt(row.get("scheduled_time"))
-    rt_ts = parse_dt(row.get("realtime_time"))
+def build_row(row: tuple, idx: dict) -> tuple | None:
+    """
+    Turn one raw CSV row (a sequence, indexed through the header map
+    `idx`) into a parameter tuple for UPSERT_SQL, or None if the
+    row lacks usable timestamps.
+    """
+    poll_ts = parse_dt(row[idx["poll_timestamp"]])
+    sched_ts = parse_dt(row[idx["scheduled_time"]])
+    rt_ts = parse_dt(row[idx["realtime_time"]])
 
     if poll_ts is None or sched_ts is None:
-        return
+        return None
+
+    vehicle_journey_id = row[idx["vehicle_journey_id"]]
+    data_freshness = row[idx["data_freshness"]]
 
     service_date = sched_ts.date().isoformat()
-    train_instance_id = f"{row['vehicle_journey_id']}_{service_date}"
+    train_instance_id = f"{vehicle_journey_id}_{service_date}"
 
-    seen_base = int(row.get("data_freshness") == "base_schedule")
-    seen_rt = int(row.get("data_freshness") == "realtime")
+    seen_base = int(data_freshness == "base_schedule")
+    seen_rt = int(data_freshness == "realtime")
 
     last_seen_delta = (
         int((rt_ts - poll_ts).total_seconds())
         if rt_ts else None
     )
 
-    delay_sec = (
-        int(row["delay_sec"])
-        if row.get("delay_sec") not in (None, "")
-        else None
-    )
+    # delay_sec comes from the scraper as an int or empty string;
+    # a truthiness check is enough ("0" is a real zero delay).
+    raw_delay = row[idx["delay_sec"]]
+    delay_sec = int(raw_delay) if raw_delay else None
 
     # Cancellation logic handled later → default False
     possibly_cancelled = 0
 
-    cur.execute("""
-    INSERT INTO trains VALUES (
-        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
-    )
-    ON CONFLICT(train_instance_id) DO UPDATE SET
-        realtime_time = excluded.realtime_time,
-        delay_sec = excluded.delay_sec,
-        last_seen_delta_sec = excluded.last_seen_delta_sec,
-        last_poll_timestamp = excluded.last_poll_timestamp,
-
-        nb_observations = trains.nb_observations + 1,
-        seen_base_schedule = MAX(trains.seen_base_schedule, excluded.seen_base_schedule),
-        seen_realtime = MAX(trains.seen_realtime, excluded.seen_realtime),
-        train_type = COALESCE(trains.train_type, excluded.train_type),
-        possibly_cancelled = trains.possibly_cancelled
-
-    WHERE excluded.last_poll_timestamp > trains.last_poll_timestamp
-    """, (
+    # Hour bucket used by the weather join, computed once here so no
+    # query ever has to strftime over millions of rows.
+    weather_hour = (rt_ts or sched_ts).replace(
+        minute=0, second=0, microsecond=0
+    ).isoformat(sep=" ")
+
+    return (
         train_instance_id,
-        row["vehicle_journey_id"],
+        vehicle_journey_id,
         service_date,
-        row["stop_area_id"],
-        row.get("train_type"),
+        row[idx["stop_area_id"]],
+        row[idx["train_type"]] or None,
         sched_ts.isoformat(),
         rt_ts.isoformat() if rt_ts else None,
         delay_sec,
@@ -125,43 +241,171 @@ def upsert_train(cur, row: dict):
         seen_base,
         seen_rt,
         last_seen_delta,
-        poll_ts.isoformat()
-    ))
+        poll_ts.isoformat(),
+        weather_hour
+    )
 
 
-def aggregate_raw_files(raw_dir: Path, db_path: Path, commit_every: int):
-    conn = init_db(db_path)
+def stage_raw_files(
+    raw_files: list[Path],
+    staging_path: str,
+    commit_every: int,
+    cutoff: str | None = None,
+) -> int:
+    """
+    Parse a batch of raw files and upsert them into a private staging
+    database. Runs in a worker process; the staging file is merged
+    into the main database by the parent.
+
+    Rows polled at or before `cutoff` (the max last_poll_timestamp
+    already in the main database) are dropped before parsing.
+    """
+    conn = sqlite3.connect(staging_path)
     cur = conn.cursor()
 
-    raw_files = sorted(
-        p for p in raw_dir.glob("raw_*.csv")
-        if not p.name.endswith("_parsed.csv")
-    )
+    # Staging files are throwaway: no durability needed.
+    cur.execute("PRAGMA journal_mode=OFF")
+    cur.execute("PRAGMA synchronous=OFF")
+    cur.execute(CREATE_TRAINS_SQL)
 
-    logging.info("Found %d raw files", len(raw_files))
     processed = 0
+    buf = []
+
+    def flush():
+        cur.executemany(UPSERT_SQL, buf)
+        conn.commit()
+        buf.clear()
 
     for raw_file in raw_files:
-        logging.info("Processing %s", raw_file.name)
+        # pandas' C engine parses the file in native code; rows come
+        # out as plain tuples for build_row's positional indexing.
+        try:
+            df = pd.read_csv(
+                raw_file, dtype=str, keep_default_na=False, engine="c"
+            )
+        except pd.errors.EmptyDataError:
+            logging.warning("Empty file: %s", raw_file.name)
+            continue
 
-        with raw_file.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
+        idx = {name: i for i, name in enumerate(df.columns)}
+        poll_i = idx["poll_timestamp"]
 
-            for row in tqdm(reader, desc=raw_file.name, unit="rows"):
-                try:
-                    upsert_train(cur, row)
-                    processed += 1
+        for row in df.itertuples(index=False, name=None):
+            # Poll timestamps are ISO strings, so the cutoff can be
+            # compared lexicographically without parsing.
+            if cutoff is not None and row[poll_i] <= cutoff:
+                continue
 
-                    if processed % commit_every == 0:
-                        conn.commit()
+            try:
+                params = build_row(row, idx)
+            except Exception as e:
+                logging.warning("Skipping row: %s", e)
+                continue
 
-                except Exception as e:
-                    logging.warning("Skipping row: %s", e)
+            if params is None:
+                continue
 
-        conn.commit()
-        raw_file.rename(raw_file.with_name(raw_file.stem + "_parsed.csv"))
+            buf.append(params)
+            processed += 1
+
+            if len(buf) >= commit_every:
+                flush()
+
+        if buf:
+            flush()
 
     conn.commit()
+    conn.close()
+    return processed
+
+
+def aggregate_raw_files(
+    raw_dir: Path,
+    db_path: Path,
+    commit_every: int,
+    workers: int = 1,
+):
+    conn = init_db(db_path)
+    cur = conn.cursor()
+
+    raw_files = sorted(
+        p for p in raw_dir.glob("raw_*.csv")
+        if not p.name.endswith("_parsed.csv")
+    )
+
+    logging.info("Found %d raw files", len(raw_files))
+    if not raw_files:
+        conn.close()
+        return
+
+    # Anything polled at or before this moment is already in the
+    # trains table; re-ingested raw rows can be dropped up front.
+    cutoff = cur.execute(
+        "SELECT MAX(last_poll_timestamp) FROM trains"
+    ).fetchone()[0]
+    if cutoff is not None:
+        logging.info("Skipping rows polled at or before %s", cutoff)
+
+    # First-time aggregation into an empty table: drop journaling for
+    # the bulk window (restored below) since there is nothing to lose
+    # on a crash beyond re-running the aggregation.
+    bootstrap = cutoff is None and cur.execute(
+        "SELECT COUNT(*) FROM trains"
+    ).fetchone()[0] == 0
+    if bootstrap:
+        logging.info("Empty trains table: using bootstrap fast path")
+        cur.execute("PRAGMA journal_mode=OFF")
+        cur.execute("PRAGMA synchronous=OFF")
+
+    # CSV parsing is CPU bound and SQLite is single-writer, so each
+    # worker aggregates its share of files into a private staging
+    # database; only the final merges touch the main database.
+    #
+    # Chunks must be contiguous in sorted (chronological) order and
+    # merged in that same order: MERGE_SQL's newest-poll-wins WHERE
+    # guards the whole DO UPDATE, so a later-merged staging database
+    # must only ever hold newer polls of a train, or its observation
+    # counts and seen_* flags would be silently dropped.
+    workers = max(1, min(workers, len(raw_files)))
+    chunk_size = -(-len(raw_files) // workers)
+    chunks = [
+        raw_files[i:i + chunk_size]
+        for i in range(0, len(raw_files), chunk_size)
+    ]
+    workers = len(chunks)
+
+    with tempfile.TemporaryDirectory(prefix="trains_staging_") as tmp:
+        staging_paths = [
+            os.path.join(tmp, f"staging_{i}.db") for i in range(workers)
+        ]
+
+        if workers == 1:
+            processed = stage_raw_files(
+                chunks[0], staging_paths[0], commit_every, cutoff
+            )
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                futures = [
+                    ex.submit(stage_raw_files, chunk, path, commit_every, cutoff)
+                    for chunk, path in zip(chunks, staging_paths)
+                ]
+                processed = sum(f.result() for f in futures)
+
+        for i, path in enumerate(tqdm(staging_paths, desc="Merging", unit="db")):
+            cur.execute("ATTACH DATABASE ? AS staging", (path,))
+            # Only the very first staging batch can rely on the table
+            # being empty; later batches may collide with each other.
+            cur.execute(BOOTSTRAP_MERGE_SQL if bootstrap and i == 0 else MERGE_SQL)
+            conn.commit()
+            cur.execute("DETACH DATABASE staging")
+
+    if bootstrap:
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+
+    for raw_file in raw_files:
+        raw_file.rename(raw_file.with_name(raw_file.stem + "_parsed.csv"))
+
     conn.close()
     logging.info("Aggregation finished (%d rows processed)", processed)
 
@@ -188,6 +432,12 @@ def parse_args():
         default=1000,
         help="Commit every N rows"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of parallel staging processes"
+    )
     parser.add_argument(
         "--log-level",
         default="INFO"
@@ -203,7 +453,8 @@ def main():
     aggregate_raw_files(
         raw_dir=args.raw_dir,
         db_path=args.db,
-        commit_every=args.commit_every
+        commit_every=args.commit_every,
+        workers=args.workers
     )
 
 
@@ -17,34 +17,6 @@ def floor_to_hour(ts: pd.Timestamp) -> pd.Timestamp:
     return ts.replace(minute=0, second=0, microsecond=0)
 
 
-def season_from_month(month: int) -> str:
-    if month in (12, 1, 2):
-        return "winter"
-    if month in (3, 4, 5):
-        return "spring"
-    if month in (6, 7, 8):
-        return "summer"
-    return "autumn"
-
-
-def sql_safe(value):
-    """
-    Convert pandas / numpy missing values to None for SQLite.
-    """
-    if value is None:
-        return None
-
-    # pandas NA
-    if value is pd.NA:
-        return None
-
-    # numpy NaN
-    if isinstance(value, float) and np.isnan(value):
-        return None
-
-    return value
-
-
 def create_calendar_table(conn: sqlite3.Connection):
     conn.execute("""
         CREATE TABLE IF NOT EXISTS calendar (
@@ -70,19 +42,35 @@ def populate_calendar(conn: sqlite3.Connection):
         WHERE scheduled_time IS NOT NULL
     """, conn)
 
-    fr_holidays = holidays.country_holidays("FR")
+    dates = pd.to_datetime(df["date"].dropna().unique())
+    if dates.empty:
+        logging.info("Calendar rows inserted: 0")
+        return
+
+    # Materialize every French holiday over the observed year range
+    # once, so membership checks below are plain set lookups instead
+    # of lazy per-year rule evaluation.
+    years = range(dates.min().year, dates.max().year + 1)
+    holiday_set = set(holidays.country_holidays("FR", years=years).keys())
+
+    weekday = dates.weekday
+    month = dates.month
+    season = np.where(
+        month.isin((12, 1, 2)), "winter",
+        np.where(
+            month.isin((3, 4, 5)), "spring",
+            np.where(month.isin((6, 7, 8)), "summer", "autumn")
+        )
+    )
 
-    rows = []
-    for d in df["date"].dropna().unique():
-        d = pd.to_datetime(d).date()
-        rows.append((
-            d.isoformat(),
-            d.weekday(),
-            d.weekday() >= 5,
-            d in fr_holidays,
-            d.month,
-            season_from_month(d.month)
-        ))
+    rows = list(zip(
+        dates.strftime("%Y-%m-%d"),
+        weekday.tolist(),
+        (weekday >= 5).tolist(),
+        [d in holiday_set for d in dates.date],
+        month.tolist(),
+        season.tolist()
+    ))
 
     conn.executemany("""
         INSERT OR IGNORE INTO calendar
@@ -114,24 +102,17 @@ def create_weather_table(conn: sqlite3.Connection):
     conn.commit()
 
 
-def fetch_weather(lat, lon, hour_ts):
-    start = hour_ts.to_pydatetime()
-    end = (hour_ts + timedelta(hours=1)).to_pydatetime()
+# Meteostat hourly columns, in the order of the weather table.
+WEATHER_COLS = ["temp", "prcp", "snow", "wspd", "wpgt", "vis", "coco"]
+
 
+def fetch_weather_range(lat, lon, start, end) -> pd.DataFrame:
+    """
+    Fetch hourly weather for one station over [start, end] in a
+    single Meteostat call, indexed by hour.
+    """
     data = Hourly(Point(lat, lon), start, end).fetch()
-    if data.empty:
-        return None
-
-    r = data.iloc[0]
-    return (
-        r.get("temp"),
-        r.get("prcp"),
-        r.get("snow"),
-        r.get("wspd"),
-        r.get("wpgt"),
-        r.get("vis"),
-        r.get("coco")
-    )
+    return data.reindex(columns=WEATHER_COLS)
 
 
 def populate_weather(conn: sqlite3.Connection):
@@ -142,42 +123,49 @@ def populate_weather(conn: sqlite3.Connection):
             t.stop_area_id,
             s.latitude,
             s.longitude,
-            DATETIME(
-                STRFTIME('%Y-%m-%d %H:00:00',
-                    COALESCE(t.realtime_time, t.scheduled_time)
-                )
-            ) AS weather_hour
+            t.weather_hour
         FROM trains t
         JOIN stations s USING (stop_area_id)
         WHERE s.latitude IS NOT NULL
           AND s.longitude IS NOT NULL
+          AND t.weather_hour IS NOT NULL
     """, conn)
 
-    weather_cache = {}
-    rows = []
+    df["hour_dt"] = pd.to_datetime(df["weather_hour"])
 
-    for _, r in tqdm(df.iterrows(), total=len(df), desc="Weather", unit="key"):
-        key = (r.latitude, r.longitude, r.weather_hour)
+    frames = []
+    grouped = df.groupby(["latitude", "longitude"])
 
-        if key not in weather_cache:
-            try:
-                weather_cache[key] = fetch_weather(
-                    r.latitude,
-                    r.longitude,
-                    pd.to_datetime(r.weather_hour)
-                )
-            except Exception as e:
-                logging.warning("Weather fetch failed %s: %s", key, e)
-                weather_cache[key] = None
+    # One Meteostat call per station covering its full hour range,
+    # instead of one call per (station, hour).
+    for (lat, lon), group in tqdm(
+        grouped, total=grouped.ngroups, desc="Weather", unit="station"
+    ):
+        start = group["hour_dt"].min().to_pydatetime()
+        end = (group["hour_dt"].max() + timedelta(hours=1)).to_pydatetime()
 
-        if weather_cache[key] is None:
+        try:
+            data = fetch_weather_range(lat, lon, start, end)
+        except Exception as e:
+            logging.warning("Weather fetch failed (%s, %s): %s", lat, lon, e)
             continue
 
-        rows.append((
-            sql_safe(r.stop_area_id),
-            sql_safe(r.weather_hour),
-            *[sql_safe(v) for v in weather_cache[key]]
-        ))
+        if data.empty:
+            continue
+
+        merged = group.merge(
+            data, left_on="hour_dt", right_index=True, how="inner"
+        )
+        frames.append(merged[["stop_area_id", "weather_hour", *WEATHER_COLS]])
+
+    if not frames:
+        logging.info("Weather rows inserted: 0")
+        return
+
+    # NaN/NA → None in one vectorized pass instead of per-value checks.
+    out = pd.concat(frames, ignore_index=True)
+    out = out.astype(object).where(out.notna(), None)
+    rows = list(out.itertuples(index=False, name=None))
 
     conn.executemany("""
         INSERT OR IGNORE INTO weather (
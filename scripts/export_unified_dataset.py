@@ -11,7 +11,6 @@ def export_unified_dataset(db_path: Path, output_csv: Path):
     logging.info("Connecting to database: %s", db_path)
 
     conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
     cur = conn.cursor()
 
     logging.info("Running unified export query")
@@ -69,29 +68,29 @@ def export_unified_dataset(db_path: Path, output_csv: Path):
 
     LEFT JOIN weather w
         ON w.stop_area_id = t.stop_area_id
-       AND w.weather_hour = strftime(
-            '%Y-%m-%d %H:00:00',
-            COALESCE(t.realtime_time, t.scheduled_time)
-       )
+       AND w.weather_hour = t.weather_hour
 
     ORDER BY t.service_date, t.scheduled_time
     """
 
     cur.execute(query)
 
-    rows = cur.fetchall()
-    if not rows:
-        logging.warning("No rows returned by query")
-
-    logging.info("Writing CSV to %s (%d rows)", output_csv, len(rows))
+    logging.info("Writing CSV to %s", output_csv)
 
     output_csv.parent.mkdir(parents=True, exist_ok=True)
 
     with output_csv.open("w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
-        writer.writerow(rows[0].keys())
-        for row in rows:
-            writer.writerow(row)
+        writer.writerow(d[0] for d in cur.description)
+
+        # The cursor yields plain tuples, which csv.writer consumes
+        # directly; rows stream through without batch bookkeeping.
+        first = cur.fetchone()
+        if first is None:
+            logging.warning("No rows returned by query")
+        else:
+            writer.writerow(first)
+            writer.writerows(cur)
 
     conn.close()
     logging.info("Export completed successfully")
@@ -15,6 +15,17 @@ BASE_URL = "https://api.sncf.com/v1/coverage/sncf/stop_areas"
 DEFAULT_PAGE_SIZE = 200
 DEFAULT_SLEEP = 0.2
 
+INSERT_STATION_SQL = """
+INSERT OR IGNORE INTO stations (
+    stop_area_id,
+    name,
+    latitude,
+    longitude,
+    timezone,
+    administrative_region
+) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
 
 def setup_logging(level: str) -> None:
     logging.basicConfig(
@@ -52,19 +63,6 @@ def init_db(db_path: str) -> sqlite3.Connection:
     return conn
 
 
-def insert_station(conn: sqlite3.Connection, row: List):
-    conn.execute("""
-    INSERT OR IGNORE INTO stations (
-        stop_area_id,
-        name,
-        latitude,
-        longitude,
-        timezone,
-        administrative_region
-    ) VALUES (?, ?, ?, ?, ?, ?)
-    """, row)
-
-
 def fetch_stop_areas_page(
     token: str,
     start_page: int,
@@ -126,9 +124,8 @@ def fetch_all_stop_areas(
             if not stop_areas:
                 break
 
-            for sa in stop_areas:
-                insert_station(conn, parse_stop_area(sa))
-
+            page_rows = [parse_stop_area(sa) for sa in stop_areas]
+            conn.executemany(INSERT_STATION_SQL, page_rows)
             conn.commit()
             total_rows += len(stop_areas)
             start_page += 1